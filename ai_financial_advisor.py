@@ -1,8 +1,11 @@
-from typing import List, Dict
+import asyncio
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from pydantic import BaseModel, Field
-from openai import OpenAI
+from openai import AsyncOpenAI
 import config
 from database import ExpenseDatabase
+from llm_cache import SemanticCache
 
 class SavingsRecommendation(BaseModel):
     strategy: str
@@ -29,18 +32,33 @@ class FinancialAdvice(BaseModel):
 class AIFinancialAdvisor:
     def __init__(self):
         self.db = ExpenseDatabase()
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        self.llm_cache = SemanticCache(self.client)
+        self._summary_cache: Dict[int, Tuple[float, Dict]] = {}
+        self._advice_cache: Dict[int, Tuple[float, Dict]] = {}
+        # Bumped on every write so a computation that started before it isn't cached after it
+        self._versions: Dict[int, int] = {}
+        self._advice_inflight: Dict[int, asyncio.Task] = {}
+
+    def bump_version(self, user_id: int):
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self._summary_cache.pop(user_id, None)
+        self._advice_cache.pop(user_id, None)
+        self._advice_inflight.pop(user_id, None)
 
     def get_spending_summary(self, user_id: int) -> Dict:
-        df = self.db.get_user_expenses(user_id, days=90)
+        cached = self._summary_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < config.SUMMARY_CACHE_TTL:
+            return cached[1]
+        version = self._versions.get(user_id, 0)
+
+        by_cat = self.db.get_category_totals(user_id, days=90)
+        by_pay, anomalies = self.db.get_payment_summary(user_id, days=90)
         prefs = self.db.get_user_preferences(user_id) or {}
-        total = float(df["amount"].sum()) if not df.empty else 0.0
+        total = float(sum(by_cat.values()))
         monthly_avg = total / 3 if total > 0 else 0.0
-        by_cat = df.groupby("category")["amount"].sum().to_dict() if not df.empty else {}
         cat_pct = {k: (v / total * 100.0) for k, v in by_cat.items()} if total > 0 else {}
-        by_pay = df.groupby("payment_method")["amount"].sum().to_dict() if not df.empty else {}
-        anomalies = int((df["is_anomaly"] == True).sum()) if ("is_anomaly" in df) else 0
-        return {
+        summary = {
             "total_spending_90days": total,
             "monthly_average": monthly_avg,
             "category_spending": by_cat,
@@ -49,82 +67,124 @@ class AIFinancialAdvisor:
             "anomalies_detected": anomalies,
             "user_preferences": prefs
         }
+        if self._versions.get(user_id, 0) == version:
+            self._summary_cache[user_id] = (time.monotonic(), summary)
+        return summary
 
-    def generate_savings_advice(self, user_id: int) -> Dict:
-        s = self.get_spending_summary(user_id)
+    def _advice_context(self, s: Dict) -> str:
+        prefs = s["user_preferences"]
+        income = float(prefs.get("monthly_income", 0) or 0)
+        available = max(0.0, income - s["monthly_average"])
         ctx = "Spending by category:\n" + "\n".join(
             f"- {k}: {v:.1f}% (₹{s['category_spending'][k]:.2f})"
             for k, v in s["category_percentages"].items()
         )
+        return (
+            f"Monthly average spend: ₹{s['monthly_average']:.2f}\n"
+            f"Income: ₹{prefs.get('monthly_income', 'NA')}\n"
+            f"Savings goal: ₹{prefs.get('savings_goal', 'NA')}\n"
+            f"Risk tolerance: {prefs.get('risk_tolerance', 'moderate')}\n"
+            f"Available to invest monthly: ₹{available:.2f}\n\n"
+            f"{ctx}"
+        )
+
+    def get_cached_advice(self, user_id: int) -> Optional[Dict]:
+        cached = self._advice_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < config.ADVICE_CACHE_TTL:
+            return cached[1]
+        return None
+
+    async def stream_advice_summary(self, user_id: int) -> AsyncIterator[str]:
+        s = await asyncio.to_thread(self.get_spending_summary, user_id)
         messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are an expert financial advisor for Indian users."
-                    " Provide actionable savings recommendations with rupee amounts."
-                )
-            },
+            {"role": "system", "content": "You are an expert financial advisor for Indian users."},
             {
                 "role": "user",
                 "content": (
-                    f"Monthly average spend: ₹{s['monthly_average']:.2f}\n"
-                    f"Income: ₹{s['user_preferences'].get('monthly_income', 'NA')}\n"
-                    f"Savings goal: ₹{s['user_preferences'].get('savings_goal', 'NA')}\n"
-                    f"Risk tolerance: {s['user_preferences'].get('risk_tolerance', 'NA')}\n\n"
-                    f"{ctx}\n\n"
-                    "Give 3-5 strategies with estimated monthly savings and action steps."
+                    f"{self._advice_context(s)}\n\n"
+                    "In 2-3 sentences, summarise this user's spending and where they can save or invest."
                 )
             }
         ]
-        resp = self.client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
+        stream = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
             messages=messages,
-            response_format=FinancialAdvice
+            max_tokens=150,
+            stream=True
         )
-        return resp.choices[0].message.parsed.model_dump()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
-    def generate_investment_advice(self, user_id: int) -> Dict:
-        s = self.get_spending_summary(user_id)
-        income = float(s["user_preferences"].get("monthly_income", 0) or 0)
-        available = max(0.0, income - s["monthly_average"])
+    async def generate_combined_advice(self, user_id: int) -> Dict:
+        cached = self.get_cached_advice(user_id)
+        if cached is not None:
+            return cached
+
+        # Concurrent misses for the same user share one completion
+        task = self._advice_inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._compute_advice(user_id))
+            self._advice_inflight[user_id] = task
+            task.add_done_callback(
+                lambda t: self._advice_inflight.pop(user_id, None)
+                if self._advice_inflight.get(user_id) is t else None
+            )
+        return await asyncio.shield(task)
+
+    async def _compute_advice(self, user_id: int) -> Dict:
+        version = self._versions.get(user_id, 0)
+        s = await asyncio.to_thread(self.get_spending_summary, user_id)
         messages = [
             {
                 "role": "system",
                 "content": (
-                    "You are an Indian investment advisor."
-                    " Recommend PPF, EPF, NPS, FDs, equity/mutual fund SIPs, etc., with risk and returns."
+                    "You are an expert financial advisor for Indian users."
+                    " Provide actionable savings recommendations with rupee amounts, and recommend"
+                    " PPF, EPF, NPS, FDs, equity/mutual fund SIPs, etc., with risk and returns."
                 )
             },
             {
                 "role": "user",
                 "content": (
-                    f"Available to invest monthly: ₹{available:.2f}\n"
-                    f"Risk tolerance: {s['user_preferences'].get('risk_tolerance', 'moderate')}\n"
-                    "Provide 3-5 options, each with expected return, risk, minimum amount, and suitability."
+                    f"{self._advice_context(s)}\n\n"
+                    "Give 3-5 savings strategies with estimated monthly savings and action steps, "
+                    "and 3-5 investment options, each with expected return, risk, minimum amount, "
+                    "and suitability."
                 )
             }
         ]
-        resp = self.client.beta.chat.completions.parse(
+        resp = await self.client.beta.chat.completions.parse(
             model="gpt-4o-2024-08-06",
             messages=messages,
             response_format=FinancialAdvice
         )
-        return resp.choices[0].message.parsed.model_dump()
+        advice = resp.choices[0].message.parsed.model_dump()
+        if self._versions.get(user_id, 0) == version:
+            self._advice_cache[user_id] = (time.monotonic(), advice)
+        return advice
 
-    def get_quick_tip(self, user_id: int, extra: str = "") -> str:
-        s = self.get_spending_summary(user_id)
-        top_cat = max(s["category_percentages"], key=s["category_percentages"].get) if s["category_percentages"] else "general"
+    def _tip_context(self, user_id: int) -> Tuple[str, float]:
+        top_cat = self.db.get_top_category(user_id, days=90) or "general"
+        return top_cat, self.db.get_monthly_average(user_id, days=90)
+
+    async def stream_quick_tip(self, user_id: int, extra: str = "") -> AsyncIterator[str]:
+        top_cat, monthly_avg = await asyncio.to_thread(self._tip_context, user_id)
         prompt = (
-            f"Monthly avg: ₹{s['monthly_average']:.2f}\n"
+            f"Monthly avg: ₹{monthly_avg:.2f}\n"
             f"Top category: {top_cat}\n{extra}\n"
             "Give 1 practical money-saving tip in 2 sentences."
         )
-        tip = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful, concise financial coach."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=100
-        )
-        return tip.choices[0].message.content
+        messages = [
+            {"role": "system", "content": "You are a helpful, concise financial coach."},
+            {"role": "user", "content": prompt}
+        ]
+        # One index for the endpoint: tips carry no per-user data beyond these few numbers,
+        # so near-duplicate prompts from any user can share a response.
+        async for delta in self.llm_cache.cached_stream(
+            "quick_tip", messages, model="gpt-4o-mini", max_tokens=100
+        ):
+            yield delta
+
+    async def get_quick_tip(self, user_id: int, extra: str = "") -> str:
+        return "".join([c async for c in self.stream_quick_tip(user_id, extra)])
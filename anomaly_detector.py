@@ -1,58 +1,121 @@
+import threading
+import time
 import pandas as pd
 import numpy as np
+from datetime import datetime, timedelta, timezone
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-from typing import Tuple
+from typing import Dict, NamedTuple, Tuple
 import config
 from database import ExpenseDatabase
+from stats_kernels import group_mean_std
+
+CAT_TO_I = {c: i for i, c in enumerate(config.CATEGORIES)}
+PAY_TO_I = {p: i for i, p in enumerate(config.PAYMENT_METHODS)}
+CAT_EYE = np.eye(len(config.CATEGORIES), dtype=np.float32)
+# Extra all-zero row for payment methods outside the vocabulary
+PAY_EYE = np.eye(len(config.PAYMENT_METHODS) + 1, len(config.PAYMENT_METHODS), dtype=np.float32)
+
+class FittedModel(NamedTuple):
+    model: IsolationForest
+    scaler: StandardScaler
+    n_rows: int        # rows the model was trained on
+    max_id: int        # newest expense id in the training data
+    fitted_at: float   # time.monotonic() of the fit
+    trained_at: str    # UTC stamp compared against anomaly_scored_at
 
 class AnomalyDetector:
     def __init__(self, contamination: float = config.ANOMALY_CONTAMINATION):
         self.contamination = contamination
-        self.model = IsolationForest(
-            contamination=contamination,
-            random_state=42,
-            n_estimators=100
-        )
-        self.scaler = StandardScaler()
         self.db = ExpenseDatabase()
+        self._fitted: Dict[int, FittedModel] = {}
+        # Concurrent updates for one user (e.g. two quick expenses) must not fit twice
+        self._fit_locks: Dict[int, threading.Lock] = {}
 
-    def prepare_features(self, df: pd.DataFrame) -> np.ndarray:
-        df = df.copy()
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df["hour"] = df["timestamp"].dt.hour
-        df["day_of_week"] = df["timestamp"].dt.dayofweek
-        df["day_of_month"] = df["timestamp"].dt.day
+    @staticmethod
+    def prepare_features(df: pd.DataFrame) -> np.ndarray:
+        n_cat, n_pay = len(config.CATEGORIES), len(config.PAYMENT_METHODS)
+        ts = df["timestamp"].to_numpy().astype("datetime64[s]")
+        secs = ts.astype("int64")
+        days = ts.astype("datetime64[D]")
+        # "credit card" -> "credit", "UPI" -> "upi"; unknown categories fall into the last slot ("other")
+        cat_idx = np.array([CAT_TO_I.get(str(c).strip().lower(), n_cat - 1) for c in df["category"]],
+                           dtype=np.intp)
+        pay_idx = np.array([PAY_TO_I.get((str(p).lower().split() or [""])[0], n_pay)
+                            for p in df["payment_method"]], dtype=np.intp)
 
-        cat_enc = pd.get_dummies(df["category"], prefix="cat")
-        pay_enc = pd.get_dummies(df["payment_method"], prefix="pay")
+        X = np.empty((len(df), 4 + n_cat + n_pay), dtype=np.float32)
+        X[:, 0] = df["amount"].to_numpy()
+        X[:, 1] = (secs // 3600) % 24
+        X[:, 2] = (days.astype("int64") + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+        X[:, 3] = (days - days.astype("datetime64[M]")).astype("int64") + 1
+        X[:, 4:4 + n_cat] = CAT_EYE[cat_idx]
+        X[:, 4 + n_cat:] = PAY_EYE[pay_idx]
+        return X
 
-        feats = pd.concat(
-            [df[["amount", "hour", "day_of_week", "day_of_month"]], cat_enc, pay_enc],
-            axis=1
+    def _fit(self, user_id: int, df: pd.DataFrame) -> Tuple[IsolationForest, StandardScaler, str]:
+        scaler = StandardScaler()
+        model = IsolationForest(
+            contamination=self.contamination,
+            random_state=42,
+            n_estimators=50,
+            max_samples=min(256, len(df)),
+            n_jobs=-1
         )
-        feats = feats.fillna(0.0)
-        return feats.values
+        Xs = scaler.fit_transform(self.prepare_features(df)).astype(np.float32, copy=False)
+        model.fit(Xs)
+        trained_at = self._next_stamp(user_id)
+        max_id = int(df["id"].max()) if len(df) else 0
+        self._fitted[user_id] = FittedModel(model, scaler, len(df), max_id, time.monotonic(), trained_at)
+        return model, scaler, trained_at
+
+    def _next_stamp(self, user_id: int) -> str:
+        # UTC text like SQLite's CURRENT_TIMESTAMP plus microseconds, so it still compares
+        # as a string with anomaly_scored_at; kept strictly increasing per user so two fits
+        # in the same instant never leave rows from the older model looking current.
+        fmt = "%Y-%m-%d %H:%M:%S.%f"
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        prev = self._fitted.get(user_id)
+        if prev is not None:
+            last = datetime.strptime(prev.trained_at, fmt)
+            if now <= last:
+                now = last + timedelta(microseconds=1)
+        return now.strftime(fmt)
+
+    def _get_model(self, user_id: int, df: pd.DataFrame,
+                   train_df: pd.DataFrame) -> Tuple[IsolationForest, StandardScaler, str]:
+        with self._fit_locks.setdefault(user_id, threading.Lock()):
+            cached = self._fitted.get(user_id)
+            if cached is not None:
+                # Count rows added since the fit: the 90-day window size alone stays flat
+                # in steady state as old rows age out, which would never trigger a refit.
+                n_new = int((df["id"] > cached.max_id).sum())
+                fresh = time.monotonic() - cached.fitted_at < config.ANOMALY_MODEL_MAX_AGE
+                if fresh and n_new < config.ANOMALY_REFIT_GROWTH * cached.n_rows:
+                    return cached.model, cached.scaler, cached.trained_at
+            return self._fit(user_id, train_df)
 
     def detect_anomalies(self, user_id: int) -> pd.DataFrame:
         df = self.db.get_user_expenses(user_id, days=90)
         if len(df) < 10:
             return pd.DataFrame()
 
-        X = self.prepare_features(df)
-        Xs = self.scaler.fit_transform(X)
-        pred = self.model.fit_predict(Xs)
-        scores = self.model.score_samples(Xs)
+        model, scaler, trained_at = self._get_model(user_id, df, df)
+        df["is_anomaly"] = df["is_anomaly"].astype(bool)
 
-        df["is_anomaly"] = pred == -1
-        df["anomaly_score"] = -scores  # higher = more anomalous
+        # Only rows never scored ("" sorts first), or scored by an older model, need work
+        pending = (df["anomaly_scored_at"].fillna("").astype(str) < trained_at).to_numpy()
+        if pending.any():
+            new_rows = df[pending]
+            Xs = scaler.transform(self.prepare_features(new_rows)).astype(np.float32, copy=False)
+            df.loc[pending, "is_anomaly"] = model.predict(Xs) == -1
+            df.loc[pending, "anomaly_score"] = -model.score_samples(Xs)  # higher = more anomalous
 
-        for _, row in df.iterrows():
-            self.db.update_anomaly_status(
-                int(row["id"]),
-                bool(row["is_anomaly"]),
-                float(row["anomaly_score"])
-            )
+            self.db.bulk_update_anomaly(list(zip(
+                df.loc[pending, "id"].astype(int).tolist(),
+                df.loc[pending, "is_anomaly"].astype(bool).tolist(),
+                df.loc[pending, "anomaly_score"].astype(float).tolist()
+            )), scored_at=trained_at)
         return df[df["is_anomaly"]]
 
     def check_new_expense(self, user_id: int, expense_id: int) -> Tuple[bool, float, str]:
@@ -65,28 +128,28 @@ class AnomalyDetector:
             return False, 0.0, "Expense not found"
 
         hist = df[df["id"] != expense_id]
-        X_hist = self.prepare_features(hist)
-        X_new = self.prepare_features(new_df)
+        model, scaler, trained_at = self._get_model(user_id, df, hist)
+        Xs_new = scaler.transform(self.prepare_features(new_df)).astype(np.float32, copy=False)
 
-        Xs_hist = self.scaler.fit_transform(X_hist)
-        Xs_new = self.scaler.transform(X_new)
-
-        self.model.fit(Xs_hist)
-        pred = self.model.predict(Xs_new)[0]
-        score = -self.model.score_samples(Xs_new)[0]
+        pred = model.predict(Xs_new)[0]
+        score = -model.score_samples(Xs_new)[0]
         is_anom = pred == -1
 
-        self.db.update_anomaly_status(expense_id, bool(is_anom), float(score))
+        self.db.update_anomaly_status(expense_id, bool(is_anom), float(score), scored_at=trained_at)
         explanation = self._explain(new_df.iloc[0], hist)
         return bool(is_anom), float(score), explanation
 
     def _explain(self, expense: pd.Series, hist: pd.DataFrame) -> str:
         amt = float(expense["amount"])
         cat = str(expense["category"])
-        cat_hist = hist[hist["category"] == cat]
-        if len(cat_hist) >= 3:
-            avg = cat_hist["amount"].mean()
-            std = cat_hist["amount"].std(ddof=0)
+        codes, uniques = pd.factorize(hist["category"].to_numpy())
+        counts, means, stds = group_mean_std(
+            hist["amount"].to_numpy(np.float64), codes.astype(np.int64), len(uniques)
+        )
+        hit = np.nonzero(uniques == cat)[0]
+        if len(hit) and counts[hit[0]] >= 3:
+            avg = means[hit[0]]
+            std = stds[hit[0]]
             if amt > avg + 2 * std:
                 return f"This {cat} expense (₹{amt:.2f}) is significantly higher than your average (₹{avg:.2f})"
             if amt < avg - 2 * std:
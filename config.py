@@ -13,10 +13,32 @@ DB_PATH = "expenses.db"
 # Anomaly Detection Settings
 ANOMALY_CONTAMINATION = 0.1  # Expected proportion of anomalies (10%)
 ANOMALY_THRESHOLD = 0.5      # Not used directly by IsolationForest; keep for messaging
+ANOMALY_REFIT_GROWTH = 0.1   # Refit a user's cached model once 10% new rows arrived since the fit
+ANOMALY_MODEL_MAX_AGE = 86400  # ...or once the cached model is a day old (seconds)
+
+# Fixed feature vocabularies; "other" must stay last (catch-all for unknown categories)
+CATEGORIES = ("food", "groceries", "rent", "transport", "utilities",
+              "entertainment", "health", "shopping", "other")
+PAYMENT_METHODS = ("cash", "upi", "credit", "debit", "paytm", "phonepe")
 
 # Predictive Analysis Settings
 FORECAST_DAYS = 30
 MIN_DATA_POINTS = 30
+PROPHET_MIN_ROWS = 180  # below this many expenses the EWMA forecaster is used instead of Prophet
+
+# Advisor Settings
+SUMMARY_CACHE_TTL = 60  # seconds a per-user spending summary stays fresh
+ADVICE_CACHE_TTL = 600  # seconds combined savings + investment advice is reused
+
+# LLM Cache Settings
+SEMANTIC_CACHE_THRESHOLD = 0.92  # cosine similarity needed to reuse a cached response
+SEMANTIC_CACHE_TTL = 900         # seconds a cached LLM response stays valid
+SEMANTIC_CACHE_MAX_ENTRIES = 256  # per-index cap; oldest entries are evicted first
+PARSE_CACHE_TTL = 900            # seconds an LLM-parsed expense message is reused
+
+# Streaming Settings
+STREAM_EDIT_EVERY = 20       # edit the Telegram message every N streamed tokens
+STREAM_EDIT_INTERVAL = 1.0   # ...but no more often than this many seconds (avoids 429s)
 
 # Notification Settings (optional scheduling if you add cron/scheduler)
 DAILY_SUMMARY_TIME = "20:00"
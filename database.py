@@ -1,108 +1,208 @@
 import sqlite3
+import threading
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import config
 
 class ExpenseDatabase:
     def __init__(self, db_path: str = config.DB_PATH):
         self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self._lock = threading.Lock()
         self.init_database()
 
     def init_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                payment_method TEXT NOT NULL,
-                description TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_anomaly BOOLEAN DEFAULT 0,
-                anomaly_score REAL DEFAULT 0.0
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                user_id INTEGER PRIMARY KEY,
-                monthly_income REAL,
-                savings_goal REAL,
-                risk_tolerance TEXT,
-                notification_enabled BOOLEAN DEFAULT 1
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS forecasts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                forecast_date DATE NOT NULL,
-                predicted_amount REAL NOT NULL,
-                category TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self.conn.cursor()
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS expenses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    amount REAL NOT NULL,
+                    category TEXT NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    description TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    is_anomaly BOOLEAN DEFAULT 0,
+                    anomaly_score REAL DEFAULT 0.0,
+                    anomaly_scored_at DATETIME
+                )
+            """)
+            cols = {row[1] for row in cursor.execute("PRAGMA table_info(expenses)")}
+            if "anomaly_scored_at" not in cols:
+                cursor.execute("ALTER TABLE expenses ADD COLUMN anomaly_scored_at DATETIME")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_exp_user_ts
+                    ON expenses (user_id, timestamp DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_exp_user_cat
+                    ON expenses (user_id, category)
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_preferences (
+                    user_id INTEGER PRIMARY KEY,
+                    monthly_income REAL,
+                    savings_goal REAL,
+                    risk_tolerance TEXT,
+                    notification_enabled BOOLEAN DEFAULT 1
+                )
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS forecasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    forecast_date DATE NOT NULL,
+                    predicted_amount REAL NOT NULL,
+                    category TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS category_daily_rollup (
+                    user_id INTEGER NOT NULL,
+                    date DATE NOT NULL,
+                    category TEXT NOT NULL,
+                    amount REAL NOT NULL DEFAULT 0.0,
+                    PRIMARY KEY (user_id, date, category)
+                )
+            """)
+            # One-time backfill for databases created before the rollup existed
+            if cursor.execute("SELECT 1 FROM category_daily_rollup LIMIT 1").fetchone() is None:
+                cursor.execute("""
+                    INSERT INTO category_daily_rollup (user_id, date, category, amount)
+                    SELECT user_id, date(timestamp), category, SUM(amount)
+                      FROM expenses
+                     GROUP BY user_id, date(timestamp), category
+                """)
+
+            self.conn.commit()
 
     def add_expense(self, user_id: int, amount: float, category: str,
                     payment_method: str, description: str) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO expenses (user_id, amount, category, payment_method, description)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, amount, category, payment_method, description))
-        expense_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self.conn.cursor()
+            # lastrowid rather than RETURNING, which needs SQLite 3.35+
+            cursor.execute("""
+                INSERT INTO expenses (user_id, amount, category, payment_method, description)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, amount, category, payment_method, description))
+            expense_id = cursor.lastrowid
+            cursor.execute("""
+                INSERT INTO category_daily_rollup (user_id, date, category, amount)
+                VALUES (?, date('now'), ?, ?)
+                ON CONFLICT(user_id, date, category) DO UPDATE SET
+                    amount = amount + excluded.amount
+            """, (user_id, category, amount))
+            self.conn.commit()
         return expense_id
 
     def get_user_expenses(self, user_id: int, days: int = 90) -> pd.DataFrame:
-        conn = sqlite3.connect(self.db_path)
         query = """
             SELECT * FROM expenses
             WHERE user_id = ?
               AND timestamp >= datetime('now', '-' || ? || ' days')
             ORDER BY timestamp DESC
         """
-        df = pd.read_sql_query(query, conn, params=(user_id, days))
-        conn.close()
+        with self._lock:
+            df = pd.read_sql_query(query, self.conn, params=(user_id, days), parse_dates=["timestamp"])
         return df
 
-    def update_anomaly_status(self, expense_id: int, is_anomaly: bool, score: float):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE expenses
-               SET is_anomaly = ?, anomaly_score = ?
-             WHERE id = ?
-        """, (is_anomaly, score, expense_id))
-        conn.commit()
-        conn.close()
+    # Rollup-backed aggregates cover the last `days` calendar days including today (UTC),
+    # so expense-table aggregates meant to agree with them use the same day boundary.
+    def get_category_totals(self, user_id: int, days: int = 30) -> Dict[str, float]:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT category, SUM(amount) FROM category_daily_rollup
+                 WHERE user_id = ?
+                   AND date > date('now', '-' || ? || ' days')
+                 GROUP BY category
+            """, (user_id, days))
+            rows = cursor.fetchall()
+        return {c: float(a) for c, a in rows}
 
-    def save_forecast(self, user_id: int, forecasts: List[Dict]):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        for f in forecasts:
+    def get_top_category(self, user_id: int, days: int = 90) -> Optional[str]:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT category, SUM(amount) AS s FROM category_daily_rollup
+                 WHERE user_id = ?
+                   AND date > date('now', '-' || ? || ' days')
+                 GROUP BY category
+                 ORDER BY s DESC
+                 LIMIT 1
+            """, (user_id, days))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_monthly_average(self, user_id: int, days: int = 90) -> float:
+        with self._lock:
+            cursor = self.conn.cursor()
             cursor.execute("""
+                SELECT SUM(amount) * 30.0 / ? FROM category_daily_rollup
+                 WHERE user_id = ?
+                   AND date > date('now', '-' || ? || ' days')
+            """, (days, user_id, days))
+            row = cursor.fetchone()
+        return float(row[0] or 0.0)
+
+    def get_payment_summary(self, user_id: int, days: int = 90) -> Tuple[Dict[str, float], int]:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT payment_method, SUM(amount), SUM(is_anomaly) FROM expenses
+                 WHERE user_id = ?
+                   AND timestamp >= date('now', '-' || ? || ' days', '+1 day')
+                 GROUP BY payment_method
+            """, (user_id, days))
+            rows = cursor.fetchall()
+        by_pay = {p: float(a) for p, a, _ in rows}
+        anomalies = sum(int(n or 0) for _, _, n in rows)
+        return by_pay, anomalies
+
+    def update_anomaly_status(self, expense_id: int, is_anomaly: bool, score: float,
+                              scored_at: Optional[str] = None):
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE expenses
+                   SET is_anomaly = ?, anomaly_score = ?, anomaly_scored_at = ?
+                 WHERE id = ?
+            """, (is_anomaly, score, scored_at, expense_id))
+            self.conn.commit()
+
+    def bulk_update_anomaly(self, rows: List[Tuple[int, bool, float]], scored_at: Optional[str] = None):
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.executemany("""
+                UPDATE expenses
+                   SET is_anomaly = ?, anomaly_score = ?, anomaly_scored_at = ?
+                 WHERE id = ?
+            """, [(is_anomaly, score, scored_at, expense_id) for expense_id, is_anomaly, score in rows])
+            self.conn.commit()
+
+    def save_forecast(self, user_id: int, forecasts: List[Dict]):
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.executemany("""
                 INSERT INTO forecasts (user_id, forecast_date, predicted_amount, category)
                 VALUES (?, ?, ?, ?)
-            """, (user_id, f["date"], f["amount"], f.get("category", "total")))
-        conn.commit()
-        conn.close()
+            """, [(user_id, f["date"], f["amount"], f.get("category", "total")) for f in forecasts])
+            self.conn.commit()
 
     def get_user_preferences(self, user_id: int) -> Optional[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM user_preferences WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT * FROM user_preferences WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
         if row:
             columns = ["user_id", "monthly_income", "savings_goal", "risk_tolerance", "notification_enabled"]
             return dict(zip(columns, row))
@@ -110,16 +210,15 @@ class ExpenseDatabase:
 
     def set_user_preferences(self, user_id: int, monthly_income: float = None,
                              savings_goal: float = None, risk_tolerance: str = None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO user_preferences (user_id, monthly_income, savings_goal, risk_tolerance)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                monthly_income   = COALESCE(?, monthly_income),
-                savings_goal     = COALESCE(?, savings_goal),
-                risk_tolerance   = COALESCE(?, risk_tolerance)
-        """, (user_id, monthly_income, savings_goal, risk_tolerance,
-              monthly_income, savings_goal, risk_tolerance))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                INSERT INTO user_preferences (user_id, monthly_income, savings_goal, risk_tolerance)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    monthly_income   = COALESCE(?, monthly_income),
+                    savings_goal     = COALESCE(?, savings_goal),
+                    risk_tolerance   = COALESCE(?, risk_tolerance)
+            """, (user_id, monthly_income, savings_goal, risk_tolerance,
+                  monthly_income, savings_goal, risk_tolerance))
+            self.conn.commit()
@@ -0,0 +1,48 @@
+import re
+from typing import Optional, Tuple
+
+# Only "spent/paid <amount> on|for <item> ... <payment>" is handled locally; any other
+# shape (income, refunds, missing payment method, ...) is left to the LLM parser.
+EXPENSE_RE = re.compile(
+    r"^\s*(?:spent|paid)\s+(?:₹|rs\.?|inr)?\s*(?<![\d,.])(\d[\d,]*(?:\.\d+)?)\s+(?:on|for)\s+((\w+).*?)"
+    r"\s*\b(upi|cash|paytm|phonepe|credit|debit)\b",
+    re.I
+)
+
+# Connector left dangling before the payment keyword: "groceries at DMart via"
+TRAILING_CONNECTOR_RE = re.compile(r"\s+(?:via|using|with|by|through|paid|in)$", re.I)
+
+CATEGORY_ALIASES = {
+    "food": "food", "lunch": "food", "dinner": "food", "breakfast": "food",
+    "snacks": "food", "coffee": "food", "tea": "food",
+    "groceries": "groceries", "grocery": "groceries", "vegetables": "groceries",
+    "rent": "rent",
+    "transport": "transport", "travel": "transport", "cab": "transport", "uber": "transport",
+    "ola": "transport", "auto": "transport", "bus": "transport", "metro": "transport",
+    "petrol": "transport", "fuel": "transport",
+    "utilities": "utilities", "electricity": "utilities", "internet": "utilities",
+    "water": "utilities", "recharge": "utilities", "bills": "utilities",
+    "entertainment": "entertainment", "movie": "entertainment", "movies": "entertainment",
+    "health": "health", "medicine": "health", "medicines": "health",
+    "doctor": "health", "pharmacy": "health",
+    "shopping": "shopping", "clothes": "shopping",
+}
+
+PAYMENT_ALIASES = {
+    "upi": "UPI", "cash": "cash", "paytm": "Paytm", "phonepe": "PhonePe",
+    "credit": "credit card", "debit": "debit card",
+}
+
+def match_expense(msg: str) -> Optional[Tuple[float, str, str, str]]:
+    """Return (amount, category, payment_method, description) or None to defer to the LLM."""
+    m = EXPENSE_RE.search(msg)
+    if not m:
+        return None
+    category = CATEGORY_ALIASES.get(m.group(3).lower())
+    if category is None:
+        return None
+    amount = float(m.group(1).replace(",", ""))
+    if amount <= 0:
+        return None
+    description = TRAILING_CONNECTOR_RE.sub("", m.group(2).strip())
+    return amount, category, PAYMENT_ALIASES[m.group(4).lower()], description
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+import faiss
+import numpy as np
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from openai import AsyncOpenAI
+import config
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    def __init__(self, client: AsyncOpenAI,
+                 threshold: float = config.SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = config.SEMANTIC_CACHE_TTL,
+                 max_entries: int = config.SEMANTIC_CACHE_MAX_ENTRIES):
+        self.client = client
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # prompt_key -> (inner-product index over normalised embeddings, [(ts, vector, response)])
+        self._indexes: Dict[str, Tuple[faiss.IndexFlatIP, List[Tuple[float, np.ndarray, Any]]]] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    async def _embed(self, messages: List[Dict]) -> np.ndarray:
+        text = "\n".join(m["content"] for m in messages)
+        resp = await self.client.embeddings.create(model="text-embedding-3-small", input=text)
+        vec = np.asarray(resp.data[0].embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)  # inner product == cosine similarity
+        return vec
+
+    def _has_live(self, prompt_key: str) -> bool:
+        entry = self._indexes.get(prompt_key)
+        now = time.monotonic()
+        return entry is not None and any(now - it[0] < self.ttl for it in entry[1])
+
+    async def lookup(self, prompt_key: str, messages: List[Dict]) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        # Nothing live to match against: skip the embeddings round trip entirely
+        if not self._has_live(prompt_key):
+            return None, None
+        # Any cache failure (e.g. the embeddings call) is a miss; the caller still hits the LLM
+        try:
+            vec = await self._embed(messages)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None, None
+
+        index, items = self._indexes[prompt_key]
+        sims, ids = index.search(vec, min(4, index.ntotal))
+        now = time.monotonic()
+        for sim, i in zip(sims[0], ids[0]):
+            if i < 0 or sim < self.threshold:
+                break
+            ts, _, response = items[i]
+            if now - ts < self.ttl:
+                return response, vec
+        return None, vec
+
+    def store(self, prompt_key: str, messages: List[Dict], vec: Optional[np.ndarray], response: Any):
+        # Runs off the response path; the embedding (if lookup didn't compute one) is made here
+        task = asyncio.create_task(self._embed_and_store(prompt_key, messages, vec, response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _embed_and_store(self, prompt_key: str, messages: List[Dict],
+                               vec: Optional[np.ndarray], response: Any):
+        try:
+            if vec is None:
+                vec = await self._embed(messages)
+            self._store(prompt_key, vec, response)
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    def _store(self, prompt_key: str, vec: np.ndarray, response: Any):
+        now = time.monotonic()
+        # Drop other keys whose entries have all expired so idle indexes don't pile up
+        for k in [k for k in self._indexes if k != prompt_key and not self._has_live(k)]:
+            del self._indexes[k]
+        index, items = self._indexes.get(prompt_key, (None, []))
+        live = [it for it in items if now - it[0] < self.ttl]
+        live = live[max(0, len(live) - self.max_entries + 1):]  # room for the new entry
+        if index is None or len(live) != len(items):
+            # IndexFlatIP ids are positional, so expiry means rebuilding from the live entries
+            index = faiss.IndexFlatIP(vec.shape[1])
+            if live:
+                index.add(np.vstack([it[1] for it in live]))
+        index.add(vec)
+        live.append((now, vec, response))
+        self._indexes[prompt_key] = (index, live)
+
+    async def cached_stream(self, prompt_key: str, messages: List[Dict],
+                            model: str = "gpt-4o-mini", **kwargs) -> AsyncIterator[str]:
+        hit, vec = await self.lookup(prompt_key, messages)
+        if hit is not None:
+            yield hit
+            return
+
+        parts = []
+        stream = await self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, **kwargs
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+        self.store(prompt_key, messages, vec, "".join(parts))
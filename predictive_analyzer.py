@@ -1,9 +1,10 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, Optional
-from prophet import Prophet
 import config
 from database import ExpenseDatabase
+from stats_kernels import group_mean_std
 
 class PredictiveAnalyzer:
     def __init__(self):
@@ -12,15 +13,55 @@ class PredictiveAnalyzer:
         self.min_data_points = config.MIN_DATA_POINTS
 
     def _daily_series(self, df: pd.DataFrame) -> pd.DataFrame:
-        d = df.copy()
-        d["timestamp"] = pd.to_datetime(d["timestamp"])
-        d["date"] = d["timestamp"].dt.date
-        daily = d.groupby("date")["amount"].sum().reset_index()
+        daily = df.groupby(df["timestamp"].dt.normalize())["amount"].sum().reset_index()
         daily.columns = ["ds", "y"]
         return daily
 
-    def forecast_expenses_prophet(self, user_id: int) -> Dict:
+    def forecast_expenses(self, user_id: int) -> Dict:
         df = self.db.get_user_expenses(user_id, days=90)
+        if len(df) > config.PROPHET_MIN_ROWS:
+            return self.forecast_expenses_prophet(user_id, df)
+        return self.forecast_expenses_fast(user_id, df)
+
+    def forecast_expenses_fast(self, user_id: int, df: Optional[pd.DataFrame] = None) -> Dict:
+        if df is None:
+            df = self.db.get_user_expenses(user_id, days=90)
+        if len(df) < self.min_data_points:
+            return {"success": False, "message": "Not enough data for forecasting", "forecasts": []}
+
+        daily = self._daily_series(df)
+        y = daily.set_index("ds")["y"].asfreq("D", fill_value=0.0)
+
+        smooth = y.ewm(span=14).mean()
+        trend = float(smooth.iloc[-1])
+        resid_std = float((y - smooth).std(ddof=0))
+        mean = float(y.mean())
+        dow_factor = (y.groupby(y.index.dayofweek).mean() / mean) if mean > 0 else pd.Series(dtype=float)
+        dow_factor = dow_factor.reindex(range(7), fill_value=1.0)
+
+        out = []
+        for ds in pd.date_range(y.index.max() + timedelta(days=1), periods=self.forecast_days, freq="D"):
+            amt = max(0.0, trend * float(dow_factor[ds.dayofweek]))
+            out.append({
+                "date": ds.strftime("%Y-%m-%d"),
+                "amount": amt,
+                "lower_bound": max(0.0, amt - 1.28 * resid_std),  # ~80% band, matching Prophet's default
+                "upper_bound": amt + 1.28 * resid_std
+            })
+
+        self.db.save_forecast(user_id, out)
+        return {
+            "success": True,
+            "forecasts": out,
+            "total_predicted": sum(f["amount"] for f in out),
+            "model": "EWMA"
+        }
+
+    def forecast_expenses_prophet(self, user_id: int, df: Optional[pd.DataFrame] = None) -> Dict:
+        from prophet import Prophet  # heavy Stan-backed import, only paid when Prophet is used
+
+        if df is None:
+            df = self.db.get_user_expenses(user_id, days=90)
         if len(df) < self.min_data_points:
             return {"success": False, "message": "Not enough data for forecasting", "forecasts": []}
 
@@ -58,15 +99,22 @@ class PredictiveAnalyzer:
         if len(df) < self.min_data_points:
             return {"success": False, "message": "Not enough data"}
 
-        cats = df["category"].unique().tolist()
+        cat_codes, cats = pd.factorize(df["category"].to_numpy())
+        n_rows = np.bincount(cat_codes, minlength=len(cats))
+        dates = df["timestamp"].dt.normalize()
+        daily = df.groupby([cat_codes, dates])["amount"].sum()
+        _, means, stds = group_mean_std(
+            daily.to_numpy(np.float64),
+            daily.index.get_level_values(0).to_numpy(np.int64),
+            len(cats)
+        )
+
         summary = {}
-        for c in cats:
-            cdf = df[df["category"] == c]
-            if len(cdf) < 10:
+        for i, c in enumerate(cats):
+            if n_rows[i] < 10:
                 continue
-            ts = self._daily_series(cdf)
-            avg = float(ts["y"].mean())
-            std = float(ts["y"].std(ddof=0))
+            avg = float(means[i])
+            std = float(stds[i])
             summary[c] = {
                 "predicted_total": avg * self.forecast_days,
                 "daily_average": avg,
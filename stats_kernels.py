@@ -0,0 +1,31 @@
+import numpy as np
+from numba import njit
+
+@njit("Tuple((int64[:], float64[:], float64[:]))(float64[:], int64[:], int64)", cache=True)
+def group_mean_std(amounts, codes, k):
+    # Per-group count, mean and population std (ddof=0) in two passes over the data
+    counts = np.zeros(k, dtype=np.int64)
+    sums = np.zeros(k, dtype=np.float64)
+    for i in range(amounts.shape[0]):
+        c = codes[i]
+        if c >= 0:
+            counts[c] += 1
+            sums[c] += amounts[i]
+
+    means = np.zeros(k, dtype=np.float64)
+    for j in range(k):
+        if counts[j] > 0:
+            means[j] = sums[j] / counts[j]
+
+    sq = np.zeros(k, dtype=np.float64)
+    for i in range(amounts.shape[0]):
+        c = codes[i]
+        if c >= 0:
+            d = amounts[i] - means[c]
+            sq[c] += d * d
+
+    stds = np.zeros(k, dtype=np.float64)
+    for j in range(k):
+        if counts[j] > 0:
+            stds[j] = np.sqrt(sq[j] / counts[j])
+    return counts, means, stds
@@ -1,8 +1,10 @@
+import asyncio
 import logging
-from typing import Dict
-from pydantic import BaseModel, Field
-from openai import OpenAI
-from telegram import Update
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+from openai import AsyncOpenAI, LengthFinishReasonError
+from telegram import Message, Update
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
     ContextTypes, filters
@@ -13,6 +15,7 @@ from database import ExpenseDatabase
 from anomaly_detector import AnomalyDetector
 from predictive_analyzer import PredictiveAnalyzer
 from ai_financial_advisor import AIFinancialAdvisor
+from expense_parser import match_expense
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -24,30 +27,120 @@ db = ExpenseDatabase()
 anom = AnomalyDetector()
 pred = PredictiveAnalyzer()
 advisor = AIFinancialAdvisor()
-oai = OpenAI(api_key=config.OPENAI_API_KEY)
+oai = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+# normalised message -> (monotonic ts, extraction fields)
+_parse_cache: Dict[str, Tuple[float, Dict]] = {}
 
 class ExpenseData(BaseModel):
     amount: float = Field(description="Amount in rupees")
-    category: str = Field(description="Category like food, groceries, rent, etc.")
+    category: str = Field(description=f"Category, one of: {', '.join(config.CATEGORIES)}")
     payment_method: str = Field(description="cash, UPI, credit card, debit card")
     description: str = Field(description="Short description")
-
-def parse_expense(msg: str) -> Dict:
-    resp = oai.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Extract expense fields from natural language for Indian users; "
-                    "recognize UPI/Paytm/PhonePe/credit/debit/cash and common categories."
-                )
-            },
-            {"role": "user", "content": f"Parse this expense: {msg}"}
-        ],
-        response_format=ExpenseData
+    potential_anomaly_hint: bool = Field(
+        default=False,
+        description="True if the amount looks unusually high for this user's typical spending"
     )
-    return resp.choices[0].message.parsed.model_dump()
+    quick_tip: Optional[str] = Field(
+        default=None,
+        description="2-sentence money-saving tip, only when potential_anomaly_hint is true"
+    )
+
+EXTRACTION_FIELDS = {"amount", "category", "payment_method", "description"}
+
+def parse_expense_local(msg: str) -> Optional[Dict]:
+    hit = match_expense(msg)
+    if hit is None:
+        return None
+    amount, category, payment_method, description = hit
+    return ExpenseData(
+        amount=amount,
+        category=category,
+        payment_method=payment_method,
+        description=description
+    ).model_dump()
+
+async def parse_expense(msg: str, user_id: int) -> Dict:
+    local = parse_expense_local(msg)
+    if local is not None:
+        return local
+
+    # Only the extraction fields are cached: the tip and anomaly hint depend on
+    # this user's spending, so a hit falls back to get_quick_tip instead.
+    cache_key = ' '.join(msg.lower().split())
+    now = time.monotonic()
+    cached = _parse_cache.get(cache_key)
+    if cached is not None and now - cached[0] < config.PARSE_CACHE_TTL:
+        return ExpenseData(**cached[1]).model_dump()
+
+    # Ask for the anomaly tip in the same call so the anomalous path
+    # doesn't need a second round trip to get_quick_tip.
+    s = await asyncio.to_thread(advisor.get_spending_summary, user_id)
+    cat_pct = s.get("category_percentages") or {}
+    top_cat = max(cat_pct, key=cat_pct.get) if cat_pct else "general"
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Extract expense fields from natural language for Indian users; "
+                "recognize UPI/Paytm/PhonePe/credit/debit/cash and common categories.\n"
+                f"User's monthly avg spend: ₹{s.get('monthly_average', 0.0):.2f}\n"
+                f"User's top category: {top_cat}\n"
+                "If the expense looks unusually large for this user, set potential_anomaly_hint "
+                f"and also produce a 2-sentence tip conditioned on recent top category {top_cat}."
+            )
+        },
+        {"role": "user", "content": f"Parse this expense: {msg}"}
+    ]
+    # mini handles this narrow extraction; full gpt-4o only if its output fails the schema
+    parsed = None
+    for model in ("gpt-4o-mini", "gpt-4o-2024-08-06"):
+        try:
+            resp = await oai.beta.chat.completions.parse(
+                model=model,
+                messages=messages,
+                response_format=ExpenseData
+            )
+        except (ValidationError, LengthFinishReasonError) as e:
+            logger.warning(f"{model} parse failed schema validation: {e}")
+            continue
+        parsed = resp.choices[0].message.parsed
+        if parsed is not None:
+            break
+    if parsed is None:
+        raise ValueError(f"Could not parse expense: {msg}")
+    data = parsed.model_dump()
+    for k in [k for k, (ts, _) in _parse_cache.items() if now - ts >= config.PARSE_CACHE_TTL]:
+        del _parse_cache[k]
+    _parse_cache[cache_key] = (time.monotonic(), parsed.model_dump(include=EXTRACTION_FIELDS))
+    return data
+
+async def stream_to_message(message: Message, prefix: str, chunks: AsyncIterator[str]) -> str:
+    # Edit in batches; Telegram rate-limits edits (429) well below token rate
+    buf, sent, n, last = "", "", 0, time.monotonic()
+    async for delta in chunks:
+        buf += delta
+        n += 1
+        if n % config.STREAM_EDIT_EVERY == 0 and time.monotonic() - last >= config.STREAM_EDIT_INTERVAL:
+            sent = prefix + buf
+            await message.edit_text(sent)
+            last = time.monotonic()
+    if buf and prefix + buf != sent:
+        await message.edit_text(prefix + buf)
+    return buf
+
+async def fetch_advice(update: Update, user_id: int, status: str) -> Tuple[Dict, bool]:
+    status_msg = await update.message.reply_text(status)
+    cached = advisor.get_cached_advice(user_id)
+    if cached is not None:
+        return cached, False
+    # Structured call runs while a free-text summary streams into the status message
+    task = asyncio.create_task(advisor.generate_combined_advice(user_id))
+    try:
+        await stream_to_message(status_msg, "", advisor.stream_advice_summary(user_id))
+    except Exception as e:
+        logger.warning(f"Advice preview error: {e}")
+    return await task, True
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     txt = (
@@ -63,7 +156,7 @@ async def add_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     await update.message.reply_text("Processing your expense...")
     try:
-        data = parse_expense(text)
+        data = await parse_expense(text, user_id)
     except Exception as e:
         logger.error(f"Parse error: {e}")
         await update.message.reply_text(
@@ -71,15 +164,17 @@ async def add_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    exp_id = db.add_expense(
+    exp_id = await asyncio.to_thread(
+        db.add_expense,
         user_id=user_id,
         amount=float(data["amount"]),
         category=data["category"],
         payment_method=data["payment_method"],
         description=data["description"]
     )
+    advisor.bump_version(user_id)
 
-    is_anom, score, explanation = anom.check_new_expense(user_id, exp_id)
+    is_anom, score, explanation = await asyncio.to_thread(anom.check_new_expense, user_id, exp_id)
     msg = (
         f"Recorded:\n"
         f"Amount: ₹{float(data['amount']):.2f}\n"
@@ -89,21 +184,30 @@ async def add_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     if is_anom:
         msg += f"\n\nANOMALY DETECTED (Score: {score:.2f})\n{explanation}"
-        tip = advisor.get_quick_tip(user_id, f"Unusual expense: {explanation}")
-        msg += f"\n\nTip: {tip}"
+        if data.get("quick_tip"):
+            msg += f"\n\nTip: {data['quick_tip']}"
+        else:
+            reply = await update.message.reply_text(msg)
+            try:
+                await stream_to_message(
+                    reply, msg + "\n\nTip: ",
+                    advisor.stream_quick_tip(user_id, f"Unusual expense: {explanation}")
+                )
+            except Exception as e:
+                logger.warning(f"Tip stream error: {e}")
+            return
     await update.message.reply_text(msg)
 
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    df = db.get_user_expenses(user_id, days=30)
-    if df.empty:
+    by_cat = await asyncio.to_thread(db.get_category_totals, user_id, days=30)
+    if not by_cat:
         await update.message.reply_text("No expenses yet, try sending one now!")
         return
-    total = float(df["amount"].sum())
+    total = float(sum(by_cat.values()))
     avg = total / 30.0
-    by_cat = df.groupby("category")["amount"].sum().sort_values(ascending=False)
     lines = [f"Total: ₹{total:.2f}", f"Daily Avg: ₹{avg:.2f}", "By Category:"]
-    for c, a in by_cat.head(5).items():
+    for c, a in sorted(by_cat.items(), key=lambda kv: kv[1], reverse=True)[:5]:
         pct = a / total * 100 if total > 0 else 0
         lines.append(f"- {c}: ₹{a:.2f} ({pct:.1f}%)")
     await update.message.reply_text("\n".join(lines))
@@ -111,7 +215,7 @@ async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def forecast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     await update.message.reply_text("Computing forecast...")
-    fc = pred.forecast_expenses_prophet(user_id)
+    fc = await asyncio.to_thread(pred.forecast_expenses, user_id)
     if not fc["success"]:
         await update.message.reply_text(fc.get("message", "Not enough data"))
         return
@@ -123,7 +227,7 @@ async def forecast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Next Week: ₹{wk:.2f}\n"
         f"Daily Avg: ₹{total/30:.2f}"
     )
-    budget = pred.detect_budget_overrun(user_id)
+    budget = await asyncio.to_thread(pred.detect_budget_overrun, user_id)
     if budget and budget["will_exceed"]:
         msg += (
             f"\n\nBudget Alert: projected exceed by ₹{budget['excess_amount']:.2f} "
@@ -133,10 +237,9 @@ async def forecast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def advice_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    await update.message.reply_text("Generating savings recommendations...")
     try:
-        adv = advisor.generate_savings_advice(user_id)
-        header = adv.get("summary", "Savings Opportunities")
+        adv, streamed = await fetch_advice(update, user_id, "Generating savings recommendations...")
+        header = "Savings Opportunities" if streamed else adv.get("summary", "Savings Opportunities")
         body = []
         for i, r in enumerate(adv.get("savings_recommendations", [])[:3], 1):
             body.append(
@@ -149,10 +252,9 @@ async def advice_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def invest_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    await update.message.reply_text("Preparing investment recommendations...")
     try:
-        adv = advisor.generate_investment_advice(user_id)
-        header = adv.get("summary", "Investments")
+        adv, streamed = await fetch_advice(update, user_id, "Preparing investment recommendations...")
+        header = "Investments" if streamed else adv.get("summary", "Investments")
         body = []
         for i, r in enumerate(adv.get("investment_recommendations", [])[:3], 1):
             body.append(
@@ -172,13 +274,15 @@ async def setincome_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     try:
         income = float(context.args[0])
-        db.set_user_preferences(user_id, monthly_income=income)
+        await asyncio.to_thread(db.set_user_preferences, user_id, monthly_income=income)
+        advisor.bump_version(user_id)
         await update.message.reply_text(f"Monthly income set to ₹{income:.2f}")
     except ValueError:
         await update.message.reply_text("Please provide a valid number")
 
 def main():
-    app = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).build()
+    # Process updates concurrently so one user's awaited LLM/DB work doesn't queue everyone else
+    app = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("stats", stats_cmd))
     app.add_handler(CommandHandler("forecast", forecast_cmd))
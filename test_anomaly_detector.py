@@ -0,0 +1,29 @@
+import unittest
+import numpy as np
+import pandas as pd
+from anomaly_detector import AnomalyDetector
+
+class PrepareFeaturesTest(unittest.TestCase):
+    def test_time_columns_match_dt_accessors(self):
+        ts = pd.Series(pd.to_datetime([
+            "1970-01-01 00:00:00",  # epoch Thursday
+            "2024-02-29 23:59:59",  # leap day, end of day
+            "2024-03-01 00:00:01",  # month rollover
+            "2025-12-31 12:30:00",  # year end
+            "2026-01-04 06:15:00",  # Sunday
+            "2026-01-05 18:45:00",  # Monday
+            "2026-10-14 09:00:00",
+        ]))
+        df = pd.DataFrame({
+            "amount": np.arange(len(ts), dtype=float),
+            "category": "food",
+            "payment_method": "UPI",
+            "timestamp": ts,
+        })
+        X = AnomalyDetector.prepare_features(df)
+        np.testing.assert_array_equal(X[:, 1], ts.dt.hour.to_numpy())
+        np.testing.assert_array_equal(X[:, 2], ts.dt.dayofweek.to_numpy())
+        np.testing.assert_array_equal(X[:, 3], ts.dt.day.to_numpy())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from expense_parser import match_expense
+
+class MatchExpenseTest(unittest.TestCase):
+    def test_simple(self):
+        self.assertEqual(match_expense("Spent ₹500 on dinner via UPI"),
+                         (500.0, "food", "UPI", "dinner"))
+
+    def test_decimal_and_rs_prefix(self):
+        self.assertEqual(match_expense("paid Rs. 1200.50 for groceries with credit card"),
+                         (1200.5, "groceries", "credit card", "groceries"))
+
+    def test_description_keeps_free_text(self):
+        self.assertEqual(match_expense("Spent 500 on groceries at DMart via UPI"),
+                         (500.0, "groceries", "UPI", "groceries at DMart"))
+        self.assertEqual(match_expense("Paid 250 for Uber to airport using Paytm")[3],
+                         "Uber to airport")
+
+    def test_comma_amounts(self):
+        self.assertEqual(match_expense("Spent ₹1,500 on groceries via UPI")[0], 1500.0)
+        self.assertEqual(match_expense("Spent 1,00,000 on rent via debit card"),
+                         (100000.0, "rent", "debit card", "rent"))
+
+    def test_income_and_refund_go_to_llm(self):
+        self.assertIsNone(match_expense("Got 2000 for rent from flatmate via UPI"))
+        self.assertIsNone(match_expense("Refund of 300 for shopping via UPI"))
+        self.assertIsNone(match_expense("500 on lunch cash"))
+
+    def test_missing_payment_method_goes_to_llm(self):
+        self.assertIsNone(match_expense("Spent ₹500 on dinner"))
+
+    def test_unknown_category_goes_to_llm(self):
+        self.assertIsNone(match_expense("Spent ₹500 on gadgets via UPI"))
+
+    def test_zero_amount_goes_to_llm(self):
+        self.assertIsNone(match_expense("Spent 0 on lunch via cash"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+import pandas as pd
+from stats_kernels import group_mean_std
+
+class GroupMeanStdTest(unittest.TestCase):
+    def test_matches_pandas_groupby(self):
+        df = pd.DataFrame({
+            "category": ["food", "rent", "food", "transport", "food", "rent", "health"],
+            "amount": [120.0, 15000.0, 80.5, 40.0, 300.0, 15500.0, 999.0],
+        })
+        codes, uniques = pd.factorize(df["category"].to_numpy())
+        counts, means, stds = group_mean_std(
+            df["amount"].to_numpy(np.float64), codes.astype(np.int64), len(uniques)
+        )
+        expected = df.groupby("category")["amount"].agg(
+            ["count", "mean", lambda s: s.std(ddof=0)]
+        ).reindex(uniques)
+        np.testing.assert_array_equal(counts, expected["count"].to_numpy())
+        np.testing.assert_allclose(means, expected["mean"].to_numpy())
+        np.testing.assert_allclose(stds, expected.iloc[:, 2].to_numpy())
+
+    def test_empty_history(self):
+        counts, means, stds = group_mean_std(
+            np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), 0
+        )
+        self.assertEqual((len(counts), len(means), len(stds)), (0, 0, 0))
+
+    def test_missing_codes_are_skipped(self):
+        counts, means, stds = group_mean_std(
+            np.array([10.0, 20.0, 99.0]), np.array([0, 0, -1], dtype=np.int64), 1
+        )
+        self.assertEqual(counts[0], 2)
+        self.assertAlmostEqual(means[0], 15.0)
+        self.assertAlmostEqual(stds[0], 5.0)
+
+if __name__ == "__main__":
+    unittest.main()